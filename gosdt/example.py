@@ -2,7 +2,6 @@ import pandas as pd
 import numpy as np
 import time
 import pathlib
-from sklearn.ensemble import GradientBoostingClassifier
 from model.threshold_guess import compute_thresholds
 from model.gosdt import GOSDT
 
@@ -19,14 +18,13 @@ max_depth = 1
 X = pd.DataFrame(X, columns=h)
 print("X:", X.shape)
 print("y:",y.shape)
-X_train, thresholds, header, threshold_guess_time = compute_thresholds(X, y, n_est, max_depth)
+X_train, thresholds, header, threshold_guess_time, clf = compute_thresholds(X, y, n_est, max_depth, return_model=True)
 y_train = pd.DataFrame(y)
 
 # guess lower bound
 start_time = time.perf_counter()
-clf = GradientBoostingClassifier(n_estimators=n_est, max_depth=max_depth, random_state=42)
-clf.fit(X_train, y_train.values.flatten())
-warm_labels = clf.predict(X_train)
+# reuse the booster already fitted on the guessed thresholds
+warm_labels = clf.predict(X_train.values)
 
 elapsed_time = time.perf_counter() - start_time
 
@@ -38,7 +36,7 @@ labelsdir.mkdir(exist_ok=True, parents=True)
 
 labelpath = labelsdir / 'warm_label.tmp'
 labelpath = str(labelpath)
-pd.DataFrame(warm_labels, columns=["class_labels"]).to_csv(labelpath, header="class_labels",index=None)
+np.savetxt(labelpath, warm_labels, fmt='%s', header='class_labels', comments='')
 
 
 # train GOSDT model
@@ -10,85 +10,188 @@ import pathlib
 
 from math import ceil
 from sklearn.model_selection import KFold, cross_val_score, train_test_split
-from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn import metrics
-
-
-# fit the tree using gradient boosted classifier
-def fit_boosted_tree(X, y, n_est=10, lr=0.1, d=1):
-    clf = GradientBoostingClassifier(loss='log_loss', learning_rate=lr, n_estimators=n_est, max_depth=d,
-                                    random_state=42)
+from sklearn.preprocessing import LabelEncoder
+
+from .threshold_kernels import binarize
+
+
+# fit the tree using histogram-based gradient boosted classifier
+def fit_boosted_tree(X, y, n_est=10, lr=0.1, d=1, device='cpu', score=True):
+    if device == 'cpu':
+        # unbounded leaf count, unit leaf size and no early stopping mirror the exact-split GBDT settings
+        clf = HistGradientBoostingClassifier(loss='log_loss', learning_rate=lr, max_iter=n_est, max_depth=d,
+                                             max_leaf_nodes=None, min_samples_leaf=1, early_stopping=False,
+                                             random_state=42)
+    else:
+        # xgboost is an optional dependency, only needed to train on a GPU
+        from xgboost import XGBClassifier
+        clf = LabelEncodedClassifier(XGBClassifier(learning_rate=lr, n_estimators=n_est, max_depth=d,
+                                                   tree_method='hist', device=device, random_state=42))
+        # xgboost rejects feature names containing [, ] or < (e.g. 'age:<21'), so fit it on plain arrays
+        X = np.asarray(X)
     clf.fit(X, y)
-    out = clf.score(X, y)
+    # scoring costs a full predict pass, skip it when the caller only needs the fitted trees
+    out = clf.score(X, y) if score else None
     return clf, out
 
 
+# XGBClassifier only accepts labels 0..K-1, this wrapper encodes the labels on fit and decodes them on predict
+# so the booster can be used with the original labels; everything else is forwarded to the wrapped classifier
+class LabelEncodedClassifier:
+    def __init__(self, clf):
+        self.clf = clf
+        self.encoder = LabelEncoder()
+
+    def __getattr__(self, name):
+        # only reached for attributes not set in __init__, guard against recursion before they exist
+        if name in ('clf', 'encoder'):
+            raise AttributeError(name)
+        return getattr(self.clf, name)
+
+    @property
+    def classes_(self):
+        return self.encoder.classes_
+
+    def fit(self, X, y):
+        self.clf.fit(X, self.encoder.fit_transform(y))
+        return self
+
+    def predict(self, X):
+        return self.encoder.inverse_transform(self.clf.predict(X))
+
+    def score(self, X, y):
+        return metrics.accuracy_score(y, self.predict(X))
+
+
+# (feature, threshold, gain) of the split nodes of every tree in the fitted ensemble
+# X, the training data, is only used to give xgboost splits readable thresholds
+def split_nodes(clf, X=None):
+    if isinstance(clf, HistGradientBoostingClassifier):
+        for predictors in clf._predictors:
+            for predictor in predictors:
+                nodes = predictor.nodes[predictor.nodes['is_leaf'] == 0]
+                yield nodes['feature_idx'], nodes['num_threshold'], nodes['gain']
+    else:
+        booster = clf.get_booster()
+        names = booster.feature_names or ['f{}'.format(j) for j in range(clf.n_features_in_)]
+        nodes = booster.trees_to_dataframe()
+        nodes = nodes[nodes['Feature'] != 'Leaf']
+        f = nodes['Feature'].map({name: j for j, name in enumerate(names)}).to_numpy(dtype=np.intp)
+        split = nodes['Split'].to_numpy(dtype=np.float64)
+        # xgboost sends x < split to the left, the largest value below split gives the same cut for <=
+        t = np.nextafter(split, -np.inf)
+        if X is not None:
+            # move each threshold to the midpoint of the training values on either side of the split,
+            # the same cut on the training data named like the CPU thresholds (e.g. age<=20.5)
+            X = np.asarray(X, dtype=np.float64)
+            for j in np.unique(f):
+                u = np.unique(X[:, j])
+                u = u[~np.isnan(u)]
+                if u.size == 0:
+                    continue
+                # u[i-1] < split <= u[i]
+                i = np.searchsorted(u, split[f == j], side='left')
+                tj = t[f == j]
+                inner = (i > 0) & (i < u.size)
+                tj[inner] = (u[i[inner]-1] + u[i[inner]]) / 2
+                # every training value lies below the split
+                tj[i == u.size] = u[-1]
+                t[f == j] = tj
+        yield f, t, nodes['Gain'].to_numpy(dtype=np.float64)
+
+
+# gain-based feature importances (not exposed by HistGradientBoostingClassifier)
+def feature_importances(clf):
+    f, _, gain = zip(*split_nodes(clf))
+    vi = np.bincount(np.concatenate(f), weights=np.concatenate(gain), minlength=clf.n_features_in_)
+    total = vi.sum()
+    return vi / total if total > 0 else vi
+
+
 # perform cut on the dataset
 def cut(X, ts):
-    df = X.copy()
     colnames = X.columns
-    for j in range(len(ts)):
-        for s in range(len(ts[j])):
-            X[colnames[j]+'<='+str(ts[j][s])] = 1
-            k = df[colnames[j]] > ts[j][s]
-            X.loc[k, colnames[j]+'<='+str(ts[j][s])] = 0
-        X = X.drop(colnames[j], axis=1)
-    return X
+    # flatten the per-feature thresholds so binarize produces every column in one call
+    feat_idx = np.fromiter((j for j in range(len(ts)) for _ in ts[j]), dtype=np.intp)
+    thr_vals = np.fromiter((t for tj in ts for t in tj), dtype=np.float64)
+    names = [colnames[j]+'<='+str(t) for j in range(len(ts)) for t in ts[j]]
+    # store the indicators as uint8 rather than int64, 1 byte per entry instead of 8,
+    # and write the comparison straight into that buffer instead of through temporaries
+    out = np.empty((X.shape[0], len(names)), dtype=np.uint8)
+    # numeric frames are compared as they are, only other dtypes pay for a float64 copy
+    values = X.to_numpy()
+    if not np.issubdtype(values.dtype, np.number):
+        values = X.to_numpy(dtype=np.float64)
+    binarize(values, feat_idx, thr_vals, out)
+    return pd.DataFrame(out, columns=names, index=X.index, copy=False)
 
 
 # compute the thresholds
-def get_thresholds(X, y, n_est, lr, d, backselect=True):
+def get_thresholds(X, y, n_est, lr, d, backselect=True, drop_rate=0.1, return_model=False, device='cpu'):
     # got a complaint here...
     y = np.ravel(y)
     # X is a dataframe
-    clf, out = fit_boosted_tree(X, y, n_est, lr, d)
+    clf, _ = fit_boosted_tree(X, y, n_est, lr, d, device, score=False)
     #print('acc:', out, 'acc cv:', score.mean())
-    thresholds = []
-    for j in range(X.shape[1]):
-        tj = np.array([])
-        for i in range(len(clf.estimators_)):
-            f = clf.estimators_[i,0].tree_.feature
-            t = clf.estimators_[i,0].tree_.threshold
-            tj = np.append(tj, t[f==j])
-        tj = np.unique(tj)
-        thresholds.append(tj.tolist())
+    # walk the ensemble once and deduplicate all (feature, threshold) pairs with a single sort
+    f, t, _ = zip(*split_nodes(clf, X))
+    pairs = np.empty(sum(fi.size for fi in f), dtype=[('f', np.intp), ('t', np.float64)])
+    pairs['f'] = np.concatenate(f)
+    pairs['t'] = np.concatenate(t)
+    pairs = np.unique(pairs)
+    # the pairs are sorted by feature, so each feature's thresholds form one contiguous run
+    bounds = np.searchsorted(pairs['f'], np.arange(X.shape[1]+1))
+    thresholds = [pairs['t'][bounds[j]:bounds[j+1]].tolist() for j in range(X.shape[1])]
 
     X_new = cut(X, thresholds)
-    clf1, out1 = fit_boosted_tree(X_new, y, n_est, lr, d)
+    Xv = X_new.to_numpy()
+    clf1, out1 = fit_boosted_tree(Xv, y, n_est, lr, d, device)
     #print('acc','1:', out1, 'acc1 cv:', scorep.mean())
 
-    outp = 1
-    Xp = X_new.copy()
+    # track the surviving columns with a mask instead of copying the frame on every drop
+    keep = np.ones(Xv.shape[1], dtype=bool)
     clfp = clf1
-    itr=0
     if backselect:
-        while outp >= out1 and itr < X_new.shape[1]-1:
-            vi = clfp.feature_importances_
-            if vi.size > 0:
-                c = Xp.columns
-                i = np.argmin(vi)
-                Xp = Xp.drop(c[i], axis=1)
-                clfp, outp = fit_boosted_tree(Xp, y, n_est, lr, d)
-                itr += 1
+        # drop the k least important columns per refit, halving k whenever a batch costs accuracy,
+        # and never go below two columns (the last drop used to be added back once one remained)
+        k = max(1, int(drop_rate * Xv.shape[1]))
+        while keep.sum() > 2:
+            vi = feature_importances(clfp)
+            kept = np.flatnonzero(keep)
+            k = min(k, kept.size-2)
+            trial = keep.copy()
+            trial[kept[np.argsort(vi, kind='stable')[:k]]] = False
+            clft, outt = fit_boosted_tree(Xv[:, trial], y, n_est, lr, d, device)
+            if outt >= out1:
+                keep, clfp = trial, clft
+            elif k > 1:
+                k //= 2
             else:
                 break
-        Xp[c[i]] = X_new[c[i]]
         #_, _ = fit_boosted_tree(Xp, y, n_est, lr, d)
 
+    Xp = X_new.loc[:, keep]
     h = Xp.columns
     #print('features:', h)
+    if return_model:
+        # clfp is fitted on exactly the returned columns, so callers can reuse it for predictions
+        return Xp, thresholds, h, clfp
     return Xp, thresholds, h
 
 # compute the thresholds
-def compute_thresholds(X, y, n_est, max_depth) :
+def compute_thresholds(X, y, n_est, max_depth, return_model=False, device='cpu') :
     # n_est, max_depth: GBDT parameters
+    # device: 'cpu', or a GPU device such as 'cuda' to train with xgboost
     # set LR to 0.1
     lr = 0.1
     start = time.perf_counter()
-    X, thresholds, header = get_thresholds(X, y, n_est, lr, max_depth, backselect=True)
+    result = get_thresholds(X, y, n_est, lr, max_depth, backselect=True, return_model=return_model,
+                            device=device)
     guess_time = time.perf_counter()-start
 
-    return X, thresholds, header, guess_time
+    return result[:3] + (guess_time,) + result[3:]
 
 
 
@@ -0,0 +1,63 @@
+import numpy as np
+
+# outputs with at least this many entries are binarized by the numba kernel when numba is installed;
+# importing numba and compiling the kernel (in every process, for each input dtype) costs about 1-2 s,
+# while the kernel saves only a few ns per entry over numpy, so smaller outputs stay on numpy
+NUMBA_MIN_SIZE = 1 << 29
+
+# runs of at least this many thresholds on one feature are binarized with one searchsorted,
+# shorter runs (the common case, depth-1 boosting gives a handful per feature) are compared directly
+SEARCHSORTED_MIN_RUN = 16
+
+
+def binarize(X, feat_idx, thr_vals, out):
+    """
+    Parameters
+    ---
+    X : matrix-like, shape = [n_samples by m_features]
+        numeric (float or integer) matrix containing the samples to binarize
+    feat_idx : array-like, shape = [t_thresholds]
+        feature index of each threshold
+    thr_vals : array-like, shape = [t_thresholds]
+        value of each threshold
+    out : matrix-like, shape = [n_samples by t_thresholds]
+        uint8 matrix receiving the indicators
+    Modifies
+    ---
+    out is set to 1 where X[:, feat_idx] <= thr_vals (or X is NaN) and 0 otherwise
+    """
+    if out.size >= NUMBA_MIN_SIZE:
+        # numba is an optional dependency, only imported once an output is large enough to need it
+        try:
+            from .threshold_kernels_numba import binarize as kernel
+        except ImportError:
+            kernel = None
+        if kernel is not None:
+            kernel(X, feat_idx, thr_vals, out)
+            return
+
+    above = out.view(np.bool_)
+    starts = np.flatnonzero(np.diff(feat_idx, prepend=-1))
+    stops = np.append(starts[1:], feat_idx.size)
+    if np.all(stops - starts < SEARCHSORTED_MIN_RUN):
+        # a sample is above the threshold only if it compares greater (NaN is kept on the <= side)
+        np.greater(X[:, feat_idx], thr_vals, out=above)
+        np.logical_not(above, out=above)
+        return
+
+    for start, stop in zip(starts, stops):
+        x = X[:, feat_idx[start]]
+        thr = thr_vals[start:stop]
+        if stop - start < SEARCHSORTED_MIN_RUN:
+            np.greater(x[:, None], thr, out=above[:, start:stop])
+            np.logical_not(above[:, start:stop], out=above[:, start:stop])
+            continue
+        # one searchsorted over the run replaces one compare per threshold
+        order = np.argsort(thr, kind='stable')
+        # number of thresholds strictly below each sample (NaN is kept on the <= side of all of them)
+        bins = np.searchsorted(thr[order], x, side='left')
+        bins[np.isnan(x)] = 0
+        # x <= thr[k] exactly when no more than rank(k) thresholds lie below x
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.size)
+        np.less_equal(bins[:, None], rank, out=above[:, start:stop])
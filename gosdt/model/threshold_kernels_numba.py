@@ -0,0 +1,13 @@
+from numba import njit, prange
+
+
+# numba version of threshold_kernels.binarize, see there for the parameters
+# fastmath is left off since it assumes no NaN, which would break the NaN handling below
+# no on-disk cache, a cached kernel is tied to the module name it was compiled under (gosdt.model or model)
+# and the compile is small next to the outputs above threshold_kernels.NUMBA_MIN_SIZE
+@njit(parallel=True)
+def binarize(X, feat_idx, thr_vals, out):
+    for i in prange(X.shape[0]):
+        for k in range(feat_idx.size):
+            # a sample is above the threshold only if it compares greater (NaN is kept on the <= side)
+            out[i, k] = not X[i, feat_idx[k]] > thr_vals[k]
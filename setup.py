@@ -39,5 +39,6 @@ setup(
                       "sortedcontainers",
                       "gmpy2==2.2.0a1;python_version=='3.12'",
                       "gmpy2;python_version<'3.12'",
-                      "matplotlib"]
+                      "matplotlib"],
+    extras_require={"numba": ["numba"]}
 )